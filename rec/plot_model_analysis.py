@@ -1,71 +1,72 @@
 import os
 import json
+import functools
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Render off-screen; skips GUI backend detection
 import matplotlib.pyplot as plt
 import torch
-import torchvision
 from torchvision.utils import make_grid
 from PIL import Image
-import io
 
+@functools.lru_cache(maxsize=8)
 def load_model_analysis(json_path):
     """Load model analysis data from JSON file"""
     with open(json_path, 'r') as f:
         data = json.load(f)
     
-    # Filter out models with errors
-    valid_models = [model for model in data if 'error' not in model]
+    # Filter out models with errors (a tuple, so callers can't change the cached
+    # sequence itself; the model dicts in it are shared between calls)
+    valid_models = tuple(model for model in data if 'error' not in model)
     return valid_models
 
-def create_bar_plot(models, metric_name, title, y_label, figsize=(8, 6)):
-    """Create a bar plot for the specified metric"""
-    plt.figure(figsize=figsize)
-    
-    # Extract model names and metric values
-    model_names = [model['model_name'] for model in models]
-    metric_values = [model[metric_name] for model in models]
-    
-    # For params, convert to millions
-    if metric_name == 'total_params':
-        metric_values = [val / 1_000_000 for val in metric_values]
-        y_label = 'Parameters (M)'
+def extract_metrics(models):
+    """Extract model names, parameters (M) and GFLOPs as numpy arrays"""
+    model_names = np.array([model['model_name'] for model in models])
+    params_m = np.fromiter((model['total_params'] for model in models),
+                           dtype=np.float64, count=len(models)) / 1_000_000
+    gflops = np.fromiter((model['gflops'] for model in models),
+                         dtype=np.float64, count=len(models))
+    return model_names, params_m, gflops
+
+def create_bar_plot(model_names, metric_values, title, y_label, figsize=(8, 6)):
+    """Create a bar plot for the given metric values as an RGBA array"""
+    fig = plt.figure(figsize=figsize)
     
     # Create bar plot
     bars = plt.bar(model_names, metric_values)
     
     # Add value labels on top of each bar
-    for bar, value in zip(bars, metric_values):
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height,
-                f'{value:.2f}', ha='center', va='bottom', rotation=0)
+    plt.bar_label(bars, labels=[f'{value:.2f}' for value in metric_values], padding=2)
+    
+    # Fix the y-range up front (with headroom for the labels) instead of autoscaling
+    top = metric_values.max()
+    plt.ylim(0, top * 1.1 if top > 0 else 1)
     
     plt.title(title)
     plt.ylabel(y_label)
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout()
     
-    # Save the plot to a BytesIO object
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    
-    # Convert to PIL Image
-    plot_image = Image.open(buf)
+    plot_image = fig_to_array(fig)
+    plt.close(fig)
     return plot_image
 
-def fig_to_tensor(fig):
-    """Convert a matplotlib figure to a PyTorch tensor"""
-    # Save the figure to a BytesIO object
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
-    
-    # Open as PIL Image and convert to tensor
-    image = Image.open(buf)
-    image_tensor = torchvision.transforms.ToTensor()(image)
-    return image_tensor
+def fig_to_array(fig):
+    """Render a matplotlib figure to an RGBA uint8 numpy array (HWC)"""
+    # Read the Agg canvas directly instead of round-tripping through PNG
+    fig.canvas.draw()
+    # Copy, since the buffer is only valid while the figure is alive
+    return np.asarray(fig.canvas.buffer_rgba()).copy()
+
+def resize_image(image, target_size):
+    """Resize an RGBA array to target_size (width, height), skipping no-op resizes"""
+    if (image.shape[1], image.shape[0]) == target_size:
+        return image
+    return np.asarray(Image.fromarray(image).resize(target_size))
 
-def create_table_image(models, figsize=(10, 6)):
-    """Create a table image with model information"""
+def create_table_image(model_names, params_m, gflops, figsize=(10, 6)):
+    """Create a table image with model information as an RGBA array"""
     # Create figure and axis
     fig, ax = plt.subplots(figsize=figsize)
     
@@ -77,12 +78,8 @@ def create_table_image(models, figsize=(10, 6)):
     headers = ['Model', 'Params (M)', 'GFLOPs']
     table_data.append(headers)
     
-    for model in models:
-        model_name = model['model_name']
-        params_m = model['total_params'] / 1_000_000
-        gflops = model['gflops']
-        
-        table_data.append([model_name, f"{params_m:.2f}", f"{gflops:.2f}"])
+    for model_name, params, flops in zip(model_names, params_m, gflops):
+        table_data.append([model_name, f"{params:.2f}", f"{flops:.2f}"])
     
     # Create the table
     table = ax.table(cellText=table_data[1:], colLabels=headers, 
@@ -93,13 +90,8 @@ def create_table_image(models, figsize=(10, 6)):
     table.set_fontsize(12)
     table.scale(1.2, 1.5)
     
-    # Save the table to a PIL Image
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    table_image = Image.open(buf)
+    table_image = fig_to_array(fig)
     plt.close(fig)
-    
     return table_image
 
 def main():
@@ -113,37 +105,40 @@ def main():
         print("No valid models found in the JSON file.")
         return
     
+    # Extract metrics once and share them across all plots
+    model_names, params_m, gflops = extract_metrics(models)
+    
     # Create plots
-    params_plot = create_bar_plot(models, 'total_params', 'Model Parameters', 'Parameters (M)')
-    gflops_plot = create_bar_plot(models, 'gflops', 'Model GFLOPs', 'GFLOPs')
-    table_image = create_table_image(models)
+    params_plot = create_bar_plot(model_names, params_m, 'Model Parameters', 'Parameters (M)')
+    gflops_plot = create_bar_plot(model_names, gflops, 'Model GFLOPs', 'GFLOPs')
+    table_image = create_table_image(model_names, params_m, gflops)
     
-    # Resize all images to the same size (use the size of the first image)
-    target_size = params_plot.size
-    params_plot = params_plot.resize(target_size)
-    gflops_plot = gflops_plot.resize(target_size)
-    table_image = table_image.resize(target_size)
+    # Resize all images to the same size (use the size of the first image);
+    # the bar plots already match, so only the wider table is resampled
+    target_size = (params_plot.shape[1], params_plot.shape[0])
+    gflops_plot = resize_image(gflops_plot, target_size)
+    table_image = resize_image(table_image, target_size)
     
-    # Convert PIL images to tensors
-    params_tensor = torchvision.transforms.ToTensor()(params_plot)
-    gflops_tensor = torchvision.transforms.ToTensor()(gflops_plot)
-    table_tensor = torchvision.transforms.ToTensor()(table_image)
+    # Convert arrays to uint8 CHW tensors (no float conversion needed for display)
+    params_tensor = torch.from_numpy(params_plot).permute(2, 0, 1)
+    gflops_tensor = torch.from_numpy(gflops_plot).permute(2, 0, 1)
+    table_tensor = torch.from_numpy(table_image).permute(2, 0, 1)
     
     # Create a grid of images
     grid_tensors = torch.stack([params_tensor, gflops_tensor, table_tensor])
     grid = make_grid(grid_tensors, nrow=2, padding=20)
     # Convert grid tensor to PIL image
-    grid_image = torchvision.transforms.ToPILImage()(grid)
+    grid_image = Image.fromarray(grid.permute(1, 2, 0).numpy())
     
-    # Save the grid image
+    # Save the grid image (low compression level: faster encode, larger file)
     output_path = 'model_analysis_grid.png'
-    grid_image.save(output_path)
+    grid_image.save(output_path, compress_level=1)
     print(f"Saved grid image to {output_path}")
     
     # Also save individual images
-    params_plot.save('model_parameters.png')
-    gflops_plot.save('model_gflops.png')
-    table_image.save('model_table.png')
+    Image.fromarray(params_plot).save('model_parameters.png', compress_level=1)
+    Image.fromarray(gflops_plot).save('model_gflops.png', compress_level=1)
+    Image.fromarray(table_image).save('model_table.png', compress_level=1)
     print("Saved individual plots as well.")
 
 if __name__ == "__main__":
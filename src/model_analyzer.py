@@ -1,30 +1,81 @@
+import os
+import functools
+import multiprocessing
 import yaml
 import json
 import torch
 import timm
 from thop import profile
-from copy import deepcopy
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import argparse
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 def load_config(config_path):
     """Load model configuration from YAML file."""
     with open(config_path, 'r') as f:
         config = yaml.safe_load(f)
     return config
 
-def analyze_model(model_name, input_shape=(1, 3, 224, 224)):
-    """Analyze a model from timm and return FLOPs, MACs, and parameters."""
+# Dummy input shared by every model analyzed in a worker process
+_worker_input = None
+
+def init_worker(num_threads, input_tensor, worker_counter):
+    """Limit intra-op threads per worker and move the shared input to its device."""
+    global _worker_input
+    torch.set_num_threads(num_threads)
+    
+    # Run the traced forward pass on the GPU when one is available,
+    # giving each worker its own GPU when there are several
+    if torch.cuda.is_available():
+        with worker_counter.get_lock():
+            worker_index = worker_counter.value
+            worker_counter.value += 1
+        device = f'cuda:{worker_index % torch.cuda.device_count()}'
+    else:
+        device = 'cpu'
+    _worker_input = input_tensor.to(device)
+
+def analyze_model_in_worker(model_name):
+    """Analyze a model using the worker's shared input tensor."""
+    return analyze_model(model_name, _worker_input)
+
+def create_model(model_name):
+    """Create a timm model in eval mode."""
+    model = timm.create_model(model_name, pretrained=False,num_classes=0)
+    model.eval()
+    return model
+
+@functools.lru_cache(maxsize=1)
+def get_cached_model(model_name):
+    """Create a timm model once and reuse it, e.g. when sweeping input shapes."""
+    return create_model(model_name)
+
+def analyze_model(model_name, input_tensor, reuse_model=False):
+    """Analyze a model from timm and return FLOPs, MACs, and parameters.
+    
+    With reuse_model=True the model is kept cached for the next call with the
+    same model name; otherwise it is freed right after profiling.
+    """
     try:
-        # Create model
-        model = timm.create_model(model_name, pretrained=False,num_classes=0)
-        model.eval()
+        # Get model on the same device as the input
+        device = input_tensor.device
+        model = (get_cached_model if reuse_model else create_model)(model_name).to(device)
         
-        # Create dummy input
-        input_tensor = torch.rand(input_shape)
+        # Profile the model using thop (thop removes its hooks and buffers afterwards,
+        # so a cached model can be profiled again without a copy)
+        with torch.inference_mode():
+            macs, params = profile(model, inputs=(input_tensor,), verbose=False)
         
-        # Profile the model using thop
-        macs, params = profile(deepcopy(model), inputs=(input_tensor,), verbose=False)
+        # Release the model (unless cached) and its GPU memory before the next one
+        del model
+        if device.type == 'cuda':
+            torch.cuda.empty_cache()
         
         # Calculate FLOPs (approximately 2x MACs)
         flops = macs * 2
@@ -47,15 +98,45 @@ def analyze_model(model_name, input_shape=(1, 3, 224, 224)):
             "error": str(e)
         }
 
+def run_analysis_pool(model_names, indices, num_workers, input_tensor, results):
+    """Analyze the given models in a process pool, filling results in place.
+    
+    Returns the indices of models left unfinished because a worker died
+    (e.g. killed for running out of memory), which breaks the whole pool.
+    """
+    cpu_count = os.cpu_count() or 1
+    unfinished = []
+    # Spawn (rather than fork) workers so each can safely initialize CUDA
+    mp_context = multiprocessing.get_context('spawn')
+    worker_counter = mp_context.Value('i', 0)
+    with ProcessPoolExecutor(max_workers=num_workers,
+                             mp_context=mp_context,
+                             initializer=init_worker,
+                             initargs=(max(1, cpu_count // num_workers), input_tensor,
+                                       worker_counter)) as executor:
+        futures = {executor.submit(analyze_model_in_worker, model_names[i]): i
+                   for i in indices}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool:
+                unfinished.append(i)
+                continue
+            print(f"Analyzed model: {model_names[i]}")
+    return sorted(unfinished)
+
 def main():
     parser = argparse.ArgumentParser(description="Analyze neural network models for FLOPs, MACs, and parameters")
     parser.add_argument("--config", type=str, required=True, help="Path to the YAML configuration file")
     parser.add_argument("--output", type=str, default="model_analysis.json", help="Path to the output JSON file")
     parser.add_argument("--input_shape", type=str, default="1,3,224,224", help="Input shape as comma-separated values")
+    parser.add_argument("--workers", type=int, default=2, help="Number of models analyzed in parallel (capped at the GPU count when CUDA is available)")
     args = parser.parse_args()
     
-    # Parse input shape
+    # Parse input shape and create the dummy input once for all models
     input_shape = tuple(map(int, args.input_shape.split(',')))
+    input_tensor = torch.rand(input_shape)
     
     # Load configuration
     config = load_config(args.config)
@@ -66,17 +147,35 @@ def main():
         print("No models specified in the configuration file.")
         return
     
-    # Analyze each model
-    results = []
-    for model_name in model_names:
-        print(f"Analyzing model: {model_name}")
-        result = analyze_model(model_name, input_shape)
-        results.append(result)
+    # Analyze models in parallel, with at most one worker per GPU. Large models
+    # need a lot of memory each, so keep the default number of workers small
+    num_workers = max(1, args.workers)
+    if torch.cuda.is_available():
+        num_workers = min(num_workers, torch.cuda.device_count())
+    num_workers = min(len(model_names), num_workers)
+    results = [None] * len(model_names)
+    unfinished = run_analysis_pool(model_names, range(len(model_names)), num_workers,
+                                   input_tensor, results)
+    
+    # A dead worker breaks the whole pool, so retry the unfinished models one at a
+    # time, each in its own pool, to find the one that cannot be analyzed
+    if unfinished:
+        print(f"Worker pool broke, retrying {len(unfinished)} models one at a time")
+    for i in unfinished:
+        if run_analysis_pool(model_names, [i], 1, input_tensor, results):
+            results[i] = {
+                "model_name": model_names[i],
+                "error": "worker process terminated abruptly"
+            }
+            print(f"Failed to analyze model: {model_names[i]}")
     
     # Save results to JSON file
     output_path = Path(args.output)
-    with open(output_path, 'w') as f:
-        json.dump(results, f, indent=2)
+    if orjson is not None:
+        output_path.write_bytes(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(results, f, indent=2)
     
     print(f"Analysis completed. Results saved to {output_path}")
 